@@ -2,6 +2,8 @@
 #include <Python.h>
 #include <sys/syscall.h>
 #include <sys/mount.h>
+#include <sys/stat.h>
+#include <fcntl.h>
 #include <sched.h>
 #include <sys/wait.h>
 #include <unistd.h>
@@ -82,6 +84,142 @@ _mount(PyObject *self, PyObject *args) {
 	}
 }
 
+#define MOUNT_MANY_DOC  ".. py:function:: mount_many(mounts)\n"\
+                        "\n"\
+                        "mount several filesystems in order with a single call\n"\
+                        "\n"\
+                        ":param list mounts: sequence of ``(source, target, filesystemtype, mountflags, mountopts)``\n"\
+                        "                    tuples, each taking the same values as the arguments of :py:func:`mount`\n"\
+                        ":return: None\n"\
+                        ":raises RuntimeError: if any mount fails, the remaining mounts are not attempted\n"\
+                        "\n"
+
+static PyObject *
+_mount_many(PyObject *self, PyObject *args) {
+	PyObject *mounts, *seq;
+	const char *source, *target, *filesystemtype, *mountopts;
+	unsigned long mountflags;
+	Py_ssize_t i, n;
+
+	if (!PyArg_ParseTuple(args, "O", &mounts)) {
+		return NULL;
+	}
+
+	if ((seq = PySequence_Fast(mounts, "mounts must be a sequence")) == NULL) {
+		return NULL;
+	}
+
+	n = PySequence_Fast_GET_SIZE(seq);
+	for (i = 0; i < n; i++) {
+		if (!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(seq, i), "zszkz",
+		                      &source, &target, &filesystemtype, &mountflags, &mountopts)) {
+			Py_DECREF(seq);
+			return NULL;
+		}
+
+		if (mount(source, target, filesystemtype, mountflags, mountopts) == -1) {
+			PyErr_SetFromErrno(PyExc_RuntimeError);
+			Py_DECREF(seq);
+			return NULL;
+		}
+	}
+
+	Py_DECREF(seq);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+#define MKNODAT_MANY_DOC    ".. py:function:: mknodat_many(dirfd, nodes)\n"\
+                            "\n"\
+                            "create several special files relative to a directory file descriptor\n"\
+                            "\n"\
+                            ":param int dirfd: file descriptor of the directory to create the files in\n"\
+                            ":param list nodes: sequence of ``(name, mode, device)`` tuples, ``mode`` combines the\n"\
+                            "                   permission bits and file type, ``device`` is the value of ``os.makedev``\n"\
+                            ":return: None\n"\
+                            ":raises RuntimeError: if any mknodat fails, the remaining files are not created\n"\
+                            "\n"
+
+static PyObject *
+_mknodat_many(PyObject *self, PyObject *args) {
+	PyObject *nodes, *seq;
+	const char *name;
+	unsigned int mode;
+	unsigned long long dev;
+	int dirfd;
+	Py_ssize_t i, n;
+
+	if (!PyArg_ParseTuple(args, "iO", &dirfd, &nodes)) {
+		return NULL;
+	}
+
+	if ((seq = PySequence_Fast(nodes, "nodes must be a sequence")) == NULL) {
+		return NULL;
+	}
+
+	n = PySequence_Fast_GET_SIZE(seq);
+	for (i = 0; i < n; i++) {
+		if (!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(seq, i), "sIK", &name, &mode, &dev)) {
+			Py_DECREF(seq);
+			return NULL;
+		}
+
+		if (mknodat(dirfd, name, (mode_t)mode, (dev_t)dev) == -1) {
+			PyErr_SetFromErrno(PyExc_RuntimeError);
+			Py_DECREF(seq);
+			return NULL;
+		}
+	}
+
+	Py_DECREF(seq);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+#define SYMLINKAT_MANY_DOC  ".. py:function:: symlinkat_many(dirfd, links)\n"\
+                            "\n"\
+                            "create several symbolic links relative to a directory file descriptor\n"\
+                            "\n"\
+                            ":param int dirfd: file descriptor of the directory to create the links in\n"\
+                            ":param list links: sequence of ``(target, name)`` tuples\n"\
+                            ":return: None\n"\
+                            ":raises RuntimeError: if any symlinkat fails, the remaining links are not created\n"\
+                            "\n"
+
+static PyObject *
+_symlinkat_many(PyObject *self, PyObject *args) {
+	PyObject *links, *seq;
+	const char *target, *name;
+	int dirfd;
+	Py_ssize_t i, n;
+
+	if (!PyArg_ParseTuple(args, "iO", &dirfd, &links)) {
+		return NULL;
+	}
+
+	if ((seq = PySequence_Fast(links, "links must be a sequence")) == NULL) {
+		return NULL;
+	}
+
+	n = PySequence_Fast_GET_SIZE(seq);
+	for (i = 0; i < n; i++) {
+		if (!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(seq, i), "ss", &target, &name)) {
+			Py_DECREF(seq);
+			return NULL;
+		}
+
+		if (symlinkat(target, dirfd, name) == -1) {
+			PyErr_SetFromErrno(PyExc_RuntimeError);
+			Py_DECREF(seq);
+			return NULL;
+		}
+	}
+
+	Py_DECREF(seq);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
 #define UMOUNT_DOC  ".. py:function:: umount(target)\n"\
                     "\n"\
                     "unmount filesystem\n"\
@@ -297,6 +435,9 @@ static PyMethodDef LinuxMethods[] = {
 	{"clone", _clone, METH_VARARGS, CLONE_DOC},
 	{"sethostname", _sethostname, METH_VARARGS, SETHOSTNAME_DOC},
 	{"mount", _mount, METH_VARARGS, MOUNT_DOC},
+	{"mount_many", _mount_many, METH_VARARGS, MOUNT_MANY_DOC},
+	{"mknodat_many", _mknodat_many, METH_VARARGS, MKNODAT_MANY_DOC},
+	{"symlinkat_many", _symlinkat_many, METH_VARARGS, SYMLINKAT_MANY_DOC},
 	{"umount", _umount, METH_VARARGS, UMOUNT_DOC},
 	{"umount2", _umount2, METH_VARARGS, UMOUNT2_DOC},
     {NULL, NULL, 0, NULL}        /* Sentinel */
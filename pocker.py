@@ -12,14 +12,55 @@ Usage:
 
 from __future__ import print_function
 
-import click
+import argparse
+import errno
+import io
+import itertools
 import os
+import shutil
 import tarfile
-import uuid
+import time
 import stat
 
 import linux
 
+# 镜像是可信的，且 rootfs 中存在大量绝对路径软链接，data_filter 会拒绝它们，
+# 因此在支持 extraction filter 的版本上显式使用 fully_trusted，跳过额外检查
+_EXTRACT_KWARGS = ({'filter': tarfile.fully_trusted_filter}
+                   if hasattr(tarfile, 'fully_trusted_filter') else {})
+
+# 容器中的基础设备 (设备名，权限|设备类型，设备号)
+# 其中主次设备号可以在 host 的 /dev 下使用 ls -l 查看
+_DEVICES = tuple(
+    (name, 0o666 | dev_type, os.makedev(major, minor))
+    for name, dev_type, major, minor in (
+        ('null', stat.S_IFCHR, 1, 3),
+        ('zero', stat.S_IFCHR, 1, 5),
+        ('random', stat.S_IFCHR, 1, 8),
+        ('urandom', stat.S_IFCHR, 1, 9),
+        ('console', stat.S_IFCHR, 5, 1),
+        ('tty', stat.S_IFCHR, 5, 0),
+        ('full', stat.S_IFCHR, 1, 7),
+    )
+)
+
+# 容器 /dev 下指向标准输入输出流的软链接 (链接目标，链接名)
+_STDIO_LINKS = (
+    ('/proc/self/fd/0', 'stdin'),
+    ('/proc/self/fd/1', 'stdout'),
+    ('/proc/self/fd/2', 'stderr'),
+    ('/proc/self/fd', 'fd'),
+)
+
+# 解压镜像时跳过的特殊文件：设备文件和命名管道
+_SKIP_TYPES = frozenset({tarfile.CHRTYPE, tarfile.BLKTYPE, tarfile.FIFOTYPE})
+
+# 同一进程内生成的容器 id 的序号
+_id_counter = itertools.count()
+
+# 容器 id 到容器 mount ns inode 的映射
+_container_mnt_ns = {}
+
 
 def _get_image_path(image_name, image_dir, image_suffix='tar'):
     return os.path.join(image_dir, os.extsep.join([image_name, image_suffix]))
@@ -29,6 +70,188 @@ def _get_container_path(container_id, container_dir, *subdir_names):
     return os.path.join(container_dir, container_id, *subdir_names)
 
 
+def _is_plain_tar(image_path):
+    # 未压缩的 (ustar/gnu/pax) tar 在偏移 257 处有 ustar 魔数
+    with open(image_path, 'rb') as f:
+        return f.read(262)[257:] == b'ustar'
+
+
+def _copy_range(src_fd, dst_fd, offset, size):
+    # 通过 sendfile 在内核中直接把 tar 中的文件内容拷贝到目标文件，不经过用户态缓冲
+    # sendfile 使用显式偏移，不改变 src_fd 的文件位置，多线程共享同一个 src_fd 是安全的
+    try:
+        while size > 0:
+            sent = os.sendfile(dst_fd, src_fd, offset, size)
+            if sent == 0:
+                break
+            offset += sent
+            size -= sent
+    except OSError as e:
+        if e.errno not in (errno.EINVAL, errno.ENOSYS):
+            raise
+        while size > 0:
+            chunk = os.pread(src_fd, min(size, 1024 * 1024), offset)
+            if not chunk:
+                break
+            os.write(dst_fd, chunk)
+            offset += len(chunk)
+            size -= len(chunk)
+
+
+def _write_entry(root, member, data=None, tar_fd=None):
+    # 写出一个普通文件并恢复其属性
+    # 未提供 data 时直接从 tar_fd 中 member 的数据偏移处拷贝
+    path = os.path.join(root, member.name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        if data is None:
+            _copy_range(tar_fd, f.fileno(), member.offset_data, member.size)
+        else:
+            f.write(data)
+    _set_attrs(path, member)
+
+
+def _set_attrs(path, member):
+    # 恢复文件的属主、权限和修改时间
+    if os.geteuid() == 0:
+        os.chown(path, member.uid, member.gid)
+    os.chmod(path, member.mode)
+    os.utime(path, (member.mtime, member.mtime))
+
+
+def _extract_image(image_path, root):
+    """
+    @param image_path: the image tarball to extract
+    @param root: the directory to extract the image into
+    """
+    # 优先使用 C 实现的 bsdtar 解压，避免 tarfile 在解释器中逐块解析的开销
+    # 容器的 /dev 会被 tmpfs 覆盖，因此直接排除镜像顶层 dev 目录下的内容（包括设备文件）
+    # 模式以 ^ 锚定到路径开头，否则会误删 usr/share/foo/dev 之类的嵌套目录
+    # 注意：bsdtar 无法按文件类型过滤，dev 以外的设备文件和命名管道仍会被创建，
+    # 这与下面 tarfile 路径按 _SKIP_TYPES 跳过它们的行为不同
+    bsdtar = shutil.which('bsdtar')
+    if bsdtar:
+        import subprocess
+        subprocess.run([bsdtar, '-xpf', image_path, '-C', root,
+                        '--no-acls', '--numeric-owner',
+                        '--exclude', '^dev/*', '--exclude', '^./dev/*'],
+                       check=True)
+        # dev 目录本身也会被排除，需要补建作为 tmpfs 的挂载点
+        os.makedirs(os.path.join(root, 'dev'), exist_ok=True)
+        return
+
+    # 未压缩的 tar 中文件内容是连续存放的，可以按偏移直接 sendfile
+    tar_fd = os.open(image_path, os.O_RDONLY) if _is_plain_tar(image_path) else None
+    try:
+        _extract_members(image_path, root, tar_fd)
+    finally:
+        if tar_fd is not None:
+            os.close(tar_fd)
+
+
+def _open_image(raw, plain):
+    # 未压缩的镜像以可 seek 的 'r:' 模式打开，只读取成员头部，跳过文件内容时直接 seek，
+    # 文件内容由 sendfile 在内核中拷贝；此时不加大缓冲，否则每次 seek 后重新填充缓冲都会把
+    # 后面的文件内容读进用户态
+    if plain:
+        return tarfile.open(fileobj=raw, mode='r:')
+
+    # 压缩的镜像只能顺序解压，以流模式 'r|' 打开，
+    # 因此每个成员的内容必须在迭代到下一个成员之前读取完
+    # tarfile 默认按 10KiB 的 record 读取，套一层大缓冲减少 read 系统调用次数
+    buf = io.BufferedReader(raw, buffer_size=4 * 1024 * 1024)
+    # gzip 压缩的镜像，解压后的数据流同样再加一层缓冲
+    if buf.peek(2)[:2] == b'\x1f\x8b':
+        import gzip
+        buf = io.BufferedReader(gzip.GzipFile(fileobj=buf), buffer_size=1024 * 1024)
+        return tarfile.open(fileobj=buf, mode='r|')
+    return tarfile.open(fileobj=buf, mode='r|*')
+
+
+def _extract_members(image_path, root, tar_fd):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = min(32, (os.cpu_count() or 1) * 4)
+    # 限制已提交但未写完的文件数，避免解压速度超过磁盘写入速度时把整个镜像读进内存
+    slots = threading.BoundedSemaphore(workers * 4)
+
+    def submit(pool, *args, **kwargs):
+        slots.acquire()
+        future = pool.submit(_write_entry, *args, **kwargs)
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    # 使用 with 自动进行文件对象的清理
+    with open(image_path, 'rb', buffering=0) as raw, _open_image(raw, tar_fd is not None) as t, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        futures, hardlinks, directories = [], [], []
+        # 逐个迭代成员边读边解压，避免 getmembers() 预先扫描整个归档
+        for m in t:
+            # Fun fact: tar files may contain *nix devices! *facepalm*
+            if m.type in _SKIP_TYPES:
+                continue
+            if m.isreg():
+                # 主线程负责解析，写文件交给线程池并发完成
+                if tar_fd is not None and not m.issparse():
+                    futures.append(submit(pool, root, m, tar_fd=tar_fd))
+                else:
+                    data = t.extractfile(m).read()
+                    futures.append(submit(pool, root, m, data))
+            elif m.islnk():
+                # 硬链接的目标文件可能还在线程池中写入，留到最后处理
+                hardlinks.append(m)
+            elif m.isdir():
+                # 目录的属性在其中的文件都写完后再设置，否则修改时间会被覆盖
+                t.extract(m, root, set_attrs=False, numeric_owner=True,
+                          **_EXTRACT_KWARGS)
+                directories.append(m)
+            else:
+                t.extract(m, root, set_attrs=True, numeric_owner=True,
+                          **_EXTRACT_KWARGS)
+        for f in futures:
+            f.result()
+        for m in hardlinks:
+            t.extract(m, root, set_attrs=True, numeric_owner=True, **_EXTRACT_KWARGS)
+        # 与 extractall 一样，从最深的目录开始设置属性
+        directories.sort(key=lambda m: m.name, reverse=True)
+        for m in directories:
+            _set_attrs(os.path.join(root, m.name), m)
+
+
+def _ensure_image_unpacked(image_path, image_root):
+    """
+    @param image_path: the image tarball to extract
+    @param image_root: the directory the image is extracted to, shared by
+                       every container of this image
+    """
+    if os.path.exists(image_root):
+        return
+
+    import fcntl
+    # 用 flock 加锁，保证并发 run 同一镜像时只有一个进程在解压，其他进程阻塞等待
+    # 持锁进程退出（包括被 kill）时内核会自动释放锁，不会留下永久的死锁
+    os.makedirs(os.path.dirname(image_root), exist_ok=True)
+    lock_fd = os.open(image_root + '.lock', os.O_CREAT | os.O_WRONLY)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        # 等待锁期间其他进程可能已经解压完成，直接复用
+        # 若之前的解压失败了，image_root 仍不存在，则由当前进程重新解压
+        if os.path.exists(image_root):
+            return
+
+        # 先解压到临时目录再 rename，image_root 存在即代表解压完整
+        tmp_root = image_root + '.tmp'
+        if os.path.exists(tmp_root):
+            shutil.rmtree(tmp_root)
+        os.makedirs(tmp_root)
+        _extract_image(image_path, tmp_root)
+        os.rename(tmp_root, image_root)
+    finally:
+        # 关闭 fd 即释放锁；锁文件保留在磁盘上，删除它会让并发的加锁者锁住不同的文件
+        os.close(lock_fd)
+
+
 def create_container_root(image_name, image_dir, container_id, container_dir):
     """
     @param image_name: the image name to extract
@@ -45,16 +268,8 @@ def create_container_root(image_name, image_dir, container_id, container_dir):
     # 判断该镜像是否已被解压，已被解压的镜像文件可作为lower层，供所有相关容器复用
     # 如此既节省了容器的存储空间由加快了容器的启动速度（不用再解压镜像了）
     image_root = os.path.join(image_dir, image_name, 'rootfs')
-    if not os.path.exists(image_root):
-        os.makedirs(image_root)
-        # 使用 with 自动进行文件对象的清理
-        # 解压缩镜像文件压缩包到该容器目录中
-        with tarfile.open(image_path) as t:
-            # Fun fact: tar files may contain *nix devices! *facepalm*
-            members = [m for m in t.getmembers()
-               if m.type not in (tarfile.CHRTYPE, tarfile.BLKTYPE)]
-            t.extractall(image_root, members=members)
-        
+    _ensure_image_unpacked(image_path, image_root)
+
     # 创建 overlay 文件系统所需的目录
     # 挂载点，提供 lower 和 upper 的 merge 视图
     container_root = _get_container_path(container_id, container_dir, 'rootfs')
@@ -63,8 +278,7 @@ def create_container_root(image_name, image_dir, container_id, container_dir):
     # overlay 必须的辅助工作目录
     container_worker = _get_container_path(container_id, container_dir, 'worker')
     for dir in (container_root, container_diff, container_worker):
-        if not os.path.exists(dir):
-            os.makedirs(dir)
+        os.makedirs(dir, exist_ok=True)
 
     # 在 container/<container-id>/rootfs 处挂载堆叠文件系统 overlay
     linux.mount('overlay', container_root, 'overlay', linux.MS_NODEV,
@@ -74,85 +288,85 @@ def create_container_root(image_name, image_dir, container_id, container_dir):
     return container_root
 
 
-@click.group()
-def cli():
-    pass
-
-
 def makedev(dev_path):
     # 添加一些基础的设备
     # 挂载 pts
     devpts_path = os.path.join(dev_path, 'pts')
-    if not os.path.exists(devpts_path):
-        os.makedirs(devpts_path)
+    os.makedirs(devpts_path, exist_ok=True)
+    try:
         linux.mount('devpts', devpts_path, 'devpts', 0, '')
-
-    # 通过软链接挂载标准输入输出流设备
-    for i, dev in enumerate(['stdin', 'stdout', 'stderr']):
-        os.symlink('/proc/self/fd/%d' % i, os.path.join(dev_path, dev))
-
-    os.symlink('/proc/self/fd', os.path.join(dev_path, 'fd'))
-
-    # 挂载其他设备 设备名:(设备类型，主设备号，次设备号)
-    # 其中主次设备号可以在 host 的 /dev 下使用 ls -l 查看
-    devices = {
-        'null': (stat.S_IFCHR, 1, 3),
-        'zero': (stat.S_IFCHR, 1, 5),
-        'random': (stat.S_IFCHR, 1, 8),
-        'urandom': (stat.S_IFCHR, 1, 9),
-        'console': (stat.S_IFCHR, 5, 1),
-        'tty': (stat.S_IFCHR, 5, 0),
-        'full': (stat.S_IFCHR, 1, 7),
-    }
-    # 遍历设备字典，使用mknod在设备目录下新建设备文件
-    for device, (dev_type, major, minor) in devices.items():
-        os.mknod(os.path.join(dev_path, device), 0o666 |
-                 dev_type, os.makedev(major, minor))
-
-
-def _set_cpu_cgroup(container_id, cpu_shares):
+    except RuntimeError as e:
+        # 已经挂载过 devpts
+        if e.args[0] != errno.EBUSY:
+            raise
+
+    # 之后的软链接和设备文件都通过 dir_fd 相对设备目录创建，内核无需每次从头解析整个路径
+    # 并且每类文件只调用一次 C 扩展，在扩展内部循环发起系统调用
+    dev_fd = os.open(dev_path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        # 通过软链接挂载标准输入输出流设备
+        linux.symlinkat_many(dev_fd, _STDIO_LINKS)
+        # 按设备表使用mknod在设备目录下新建设备文件
+        linux.mknodat_many(dev_fd, _DEVICES)
+    finally:
+        os.close(dev_fd)
+
+
+def _write_sysfs(name, val, dir_fd=None):
+    # 直接用 os.open/os.write 写 cgroup 文件，一次 write 系统调用且立即 close
+    # 传入 dir_fd 时 name 相对该目录解析
+    fd = os.open(name, os.O_WRONLY, dir_fd=dir_fd)
+    try:
+        os.write(fd, str(val).encode())
+    finally:
+        os.close(fd)
+
+
+def _set_cpu_cgroup(container_id, cpu_shares, pid):
     # 创建一个新的 cpu cgroup 目录
     CPU_CGROUP_BASEDIR = '/sys/fs/cgroup/cpu'
     container_cpu_cgroup_dir = os.path.join(CPU_CGROUP_BASEDIR, 'pocker', container_id)
-    if not os.path.exists(container_cpu_cgroup_dir):
-        os.makedirs(container_cpu_cgroup_dir)
+    os.makedirs(container_cpu_cgroup_dir, exist_ok=True)
 
-    # 将当前容器进程的 pid 写入 cgroup 的 task 文件，表示当前进程受该 cgroup 管理
-    task_file = os.path.join(container_cpu_cgroup_dir, 'tasks')
-    open(task_file, 'w').write(str(os.getpid()))
-    
-    # 设置 cpu 使用限制
-    if cpu_shares:
-        cpu_shares_file = os.path.join(container_cpu_cgroup_dir, 'cpu.shares')
-        open(cpu_shares_file, 'w').write(str(cpu_shares))
+    # 打开 cgroup 目录，其中的文件都相对该目录打开
+    dir_fd = os.open(container_cpu_cgroup_dir, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        # 将容器进程的 pid 写入 cgroup 的 cgroup.procs 文件，表示该进程受该 cgroup 管理
+        _write_sysfs('cgroup.procs', pid, dir_fd)
 
+        # 设置 cpu 使用限制
+        if cpu_shares:
+            _write_sysfs('cpu.shares', cpu_shares, dir_fd)
+    finally:
+        os.close(dir_fd)
 
-def _set_mem_cgroup(container_id, memory, memory_swap):
+
+def _set_mem_cgroup(container_id, memory, memory_swap, pid):
     # 创建一个新的 memory cgroup 目录
     MEM_CGROUP_BASEDIR = '/sys/fs/cgroup/memory'
     container_mem_cgroup_dir = os.path.join(MEM_CGROUP_BASEDIR, 'pocker', container_id)
-    if not os.path.exists(container_mem_cgroup_dir):
-        os.makedirs(container_mem_cgroup_dir)
+    os.makedirs(container_mem_cgroup_dir, exist_ok=True)
 
-    # 将当前容器进程的 pid 写入 cgroup 的 task 文件，表示当前进程受该 cgroup 管理
-    task_file = os.path.join(container_mem_cgroup_dir, 'tasks')
-    open(task_file, 'w').write(str(os.getpid()))
-    
-    # 设置 memory 使用限制
-    if memory is not None:
-        memory_limit_in_bytes_file = os.path.join(container_mem_cgroup_dir, 'memory.limit_in_bytes')
-        open(memory_limit_in_bytes_file, 'w').write(str(memory))
-    # 设置 memory 交换区使用限制
-    if memory_swap is not None:
-        memsw_limit_in_bytes_file = os.path.join(container_mem_cgroup_dir, 'memory.memsw.limit_in_bytes_file')
-        open(memsw_limit_in_bytes_file, 'w').write(str(memory_swap))
+    # 打开 cgroup 目录，其中的文件都相对该目录打开
+    dir_fd = os.open(container_mem_cgroup_dir, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        # 将容器进程的 pid 写入 cgroup 的 cgroup.procs 文件，表示该进程受该 cgroup 管理
+        _write_sysfs('cgroup.procs', pid, dir_fd)
+
+        # 设置 memory 使用限制
+        if memory is not None:
+            _write_sysfs('memory.limit_in_bytes', memory, dir_fd)
+        # 设置 memory 交换区使用限制
+        if memory_swap is not None:
+            _write_sysfs('memory.memsw.limit_in_bytes', memory_swap, dir_fd)
+    finally:
+        os.close(dir_fd)
 
 
 def contain(command, image_name, image_dir, container_id, container_dir,
-            cpu_shares, memory, memory_swap):
-    # 使用 cgroup 子系统进行资源使用限制
-    _set_cpu_cgroup(container_id, cpu_shares)
-    _set_mem_cgroup(container_id, memory, memory_swap)
+            ready_r, ready_w):
+    # cgroup 由父进程设置，子进程只保留管道的读端用于等待父进程完成
+    os.close(ready_w)
 
     # 将 host 的根目录挂载状态改为私有的，保证内部 mount ns 挂载操作不会传播到 host
     linux.mount(None, '/', None, linux.MS_PRIVATE | linux.MS_REC, None)
@@ -164,60 +378,143 @@ def contain(command, image_name, image_dir, container_id, container_dir,
         image_name, image_dir, container_id, container_dir)
     print('Created a new root fs for our container: {}'.format(new_root))
 
-    # 在新的根目录下重新挂载 /proc、/sys
-    # 挂载 /proc 后就可以使用 ps 命令了，此时可以看到所有的进程，还未隔离
-    linux.mount('proc', os.path.join(new_root, 'proc'), 'proc', 0, '')
-    linux.mount('sysfs', os.path.join(new_root, 'sys'), 'sysfs', 0, '')
-
-    # 挂载一个 tmpfs 到 root/dev/ 下作为设备目录
-    dev_path = os.path.join(new_root, 'dev')
-    linux.mount('tmpfs', dev_path, 'tmpfs', linux.MS_NOSUID |
-                linux.MS_STRICTATIME, 'mode=755')
+    proc_path, sys_path, dev_path = (new_root + '/proc', new_root + '/sys',
+                                     new_root + '/dev')
+
+    # 一次调用完成以下挂载，在 C 扩展内部循环执行 mount
+    linux.mount_many([
+        # 在新的根目录下重新挂载 /proc、/sys
+        # 挂载 /proc 后就可以使用 ps 命令了，此时可以看到所有的进程，还未隔离
+        ('proc', proc_path, 'proc', 0, ''),
+        ('sysfs', sys_path, 'sysfs', 0, ''),
+        # 挂载一个 tmpfs 到 root/dev/ 下作为设备目录
+        ('tmpfs', dev_path, 'tmpfs', linux.MS_NOSUID | linux.MS_STRICTATIME, 'mode=755'),
+    ])
     # 在设备目录下添加设备
     makedev(dev_path)
 
+    # 先通过 fd 跳转到新的根目录，之后的路径都相对当前目录解析，不必每次从根开始查找
+    root_fd = os.open(new_root, os.O_RDONLY | os.O_DIRECTORY)
+    os.fchdir(root_fd)
+    os.close(root_fd)
     # 将当前进程所在mount ns的所有进程的根文件系统变为容器目录，该函数需要root权限
-    old_root = os.path.join(new_root, 'old_root')
-    os.makedirs(old_root) # 创建临时文件夹用来存放老的根目录
-    linux.pivot_root(new_root, old_root)
-    # 跳转到新的根目录下
-    os.chdir('/')
-    # 卸载老的根目录，并删除临时文件夹
-    linux.umount2('/old_root', linux.MNT_DETACH)
-    os.rmdir('/old_root')
+    os.mkdir('old_root') # 创建临时文件夹用来存放老的根目录
+    linux.pivot_root('.', 'old_root')
+    # 当前目录即为新的根目录，卸载老的根目录，并删除临时文件夹
+    linux.umount2('old_root', linux.MNT_DETACH)
+    os.rmdir('old_root')
+
+    # 等待父进程将本进程加入 cgroup，保证容器命令从第一条指令起就受到资源限制
+    # 父进程异常退出时管道被关闭，读到 EOF
+    if not os.read(ready_r, 1):
+        raise RuntimeError('failed to set up cgroups for container {}'.format(container_id))
+    os.close(ready_r)
 
     # execvp 函数能够自动从 $PATH 中寻找匹配的命令
     os.execvp(command[0], command)
 
 
-@cli.command(context_settings=dict(ignore_unknown_options=True,))
-@click.option('--memory',
-            help='Momory limit in bytes. Use suffixes to represent larger units (k, m, g)',
-            default=None)
-@click.option('--memory-swap',
-            help='A positive integer equal to memory plus swap. Specify -1 to enable unlimited swap.',
-            default=None)
-@click.option('--cpu-shares', help='CPU shares (relative weight)', default=0)
-@click.option('--image-name', '-i', help='Image name', default='ubuntu')
-@click.option('--image-dir', help='Images directory', default='./_pocker/images')
-@click.option('--container-dir', help='Containers directory', default='./_pocker/containers')
-@click.argument('Command', required=True, nargs=-1)
-def run(memory, memory_swap, cpu_shares, image_name, image_dir, container_dir, command):
-    # 为此次启动的容器确定一个随机的 id
-    contain_id = str(uuid.uuid4())
+def _wait_container(pid):
+    # 通过 pidfd 等待子进程退出，由内核在单个 fd 上通知，便于以后同时管理多个容器
+    # 不支持 pidfd_open 时（Python < 3.9 或 Linux < 5.3）退回阻塞的 waitpid
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        return os.waitpid(pid, 0)[1]
+
+    import select
+    try:
+        poller = select.poll()
+        poller.register(pidfd, select.POLLIN)
+        poller.poll()
+    finally:
+        os.close(pidfd)
+    # 子进程已退出，回收即可
+    return os.waitpid(pid, os.WNOHANG)[1]
+
+
+def run(memory, memory_swap, cpu_shares, image_name, image_dir, container_dir, id_style,
+        command):
+    # 为此次启动的容器确定一个唯一的 id
+    # 默认由时间戳、pid 和计数器组成，只需本机唯一，不必读取 /dev/urandom
+    if id_style == 'uuid':
+        import uuid
+        contain_id = str(uuid.uuid4())
+    else:
+        contain_id = '{:x}-{:x}-{:x}'.format(time.time_ns(), os.getpid(), next(_id_counter))
     
     # 无法使用先 fork 再改变子进程命名空间的方法改变 PID
     # 使用更简单的API：clone，以在创建子进程的时候就改变命名空间
     flag = ( linux.CLONE_NEWPID | linux.CLONE_NEWNS | linux.CLONE_NEWUTS | linux.CLONE_NEWNET )
+    ready_r, ready_w = os.pipe()
     callback_args = (command, image_name, image_dir, contain_id, container_dir,
-                     cpu_shares, memory, memory_swap)
+                     ready_r, ready_w)
     pid = linux.clone(contain, flag, callback_args)
+    os.close(ready_r)
+
+    # 记录容器的 mount ns inode，它在容器生命周期内不变且不会像 pid 那样被复用，
+    # 之后对容器的跟踪记录都以它为键
+    # 此时子进程还在等待父进程的通知，不会执行容器命令
+    try:
+        _container_mnt_ns[contain_id] = os.stat('/proc/{}/ns/mnt'.format(pid)).st_ino
+    except OSError:
+        # 容器进程在准备根文件系统时就已经失败退出
+        pass
+
+    # 子进程创建后立即由父进程使用 cgroup 子系统进行资源使用限制，完成后通知子进程
+    try:
+        try:
+            _set_cpu_cgroup(contain_id, cpu_shares, pid)
+            _set_mem_cgroup(contain_id, memory, memory_swap, pid)
+        except ProcessLookupError:
+            # 子进程已经提前退出，无需再设置 cgroup，照常回收并报告退出状态
+            pass
+        except BaseException:
+            # 设置 cgroup 失败，结束并回收子进程，避免留下继续运行的孤儿进程
+            import signal
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            raise
+        try:
+            os.write(ready_w, b'1')
+        except BrokenPipeError:
+            # 子进程已经提前退出（例如找不到镜像），照常回收并报告退出状态
+            pass
+    finally:
+        os.close(ready_w)
 
     # This is the parent, pid contains the PID of the forked process
     # wait for the forked child and fetch the exit status
-    _, status = os.waitpid(pid, 0)
+    status = _wait_container(pid)
     print('{} exited with status {}'.format(pid, status))
 
 
 if __name__ == '__main__':
-    cli()
+    parser = argparse.ArgumentParser(prog='pocker')
+    subparsers = parser.add_subparsers(dest='subcommand', metavar='COMMAND')
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser('run', help='Run a command in a new container')
+    run_parser.add_argument('--memory',
+                            help='Momory limit in bytes. Use suffixes to represent larger units (k, m, g)',
+                            default=None)
+    run_parser.add_argument('--memory-swap',
+                            help='A positive integer equal to memory plus swap. Specify -1 to enable unlimited swap.',
+                            default=None)
+    run_parser.add_argument('--cpu-shares', help='CPU shares (relative weight)', type=int, default=0)
+    run_parser.add_argument('--image-name', '-i', help='Image name', default='ubuntu')
+    run_parser.add_argument('--image-dir', help='Images directory', default='./_pocker/images')
+    run_parser.add_argument('--container-dir', help='Containers directory',
+                            default='./_pocker/containers')
+    run_parser.add_argument('--id-style', help='Container id style', choices=['short', 'uuid'],
+                            default='short')
+    run_parser.add_argument('command', nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+    # REMAINDER 会保留用于结束选项解析的 '--'，它不属于容器命令
+    if args.command[:1] == ['--']:
+        args.command = args.command[1:]
+    if not args.command:
+        run_parser.error('the following arguments are required: command')
+    run(args.memory, args.memory_swap, args.cpu_shares, args.image_name, args.image_dir,
+        args.container_dir, args.id_style, args.command)